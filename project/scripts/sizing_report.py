@@ -0,0 +1,28 @@
+import argparse
+import requests
+
+
+# Recommend ray_actor_options per deployment from the replica profiles.
+# Start the app with PROFILING_ENABLED=1 and run a load test first, e.g.
+# locust -f load_test/average_test.py --host=http://127.0.0.1:8000 --users 100 --run-time 5m
+def sizing_report(host):
+    response = requests.get(f"{host}/admin/sizing")
+    response.raise_for_status()
+
+    print("Sizing Report:")
+    for recommendation in response.json():
+        print(f"\n{recommendation['deployment']} ({recommendation['replicas_observed']} replica(s))")
+        print(f"  Peak RSS: {recommendation['observed_rss_peak_bytes'] / 1024 / 1024:.1f} MiB")
+        print(f"  CPU p95: {recommendation['observed_cpu_utilization_p95']:.3f} cores")
+        print(f"  Event loop lag p95: {recommendation['observed_event_loop_lag_ms_p95']:.1f}ms")
+        print(f"  ray_actor_options={recommendation['ray_actor_options']}")
+        for note in recommendation["notes"]:
+            print(f"  NOTE: {note}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="http://127.0.0.1:8000")
+    args = parser.parse_args()
+
+    sizing_report(args.host)
@@ -0,0 +1,218 @@
+import itertools
+import string
+from collections import defaultdict
+from typing import Literal
+
+import numpy as np
+import onnxruntime as rt
+import ray
+from pydantic import BaseModel
+
+from src.canary_data_models import (
+    BehavioralCategoryResult,
+    BehavioralFailure,
+    BehavioralReport,
+)
+from src.canary_model import Model
+from src.constants import LABEL_CLASS_TO_NAME, SentimentLabel
+
+NAME_TO_LABEL_CLASS = {name: label_class for label_class, name in LABEL_CLASS_TO_NAME.items()}
+
+
+def expand_template(template: str, fills: dict[str, list[str]]) -> list[dict[str, str]]:
+    """Every combination of fills for the {placeholders} used in the template"""
+    fields = list(dict.fromkeys(
+        field for _, field, _, _ in string.Formatter().parse(template) if field
+    ))
+    missing = [field for field in fields if field not in fills]
+    if missing:
+        raise ValueError(f"No fills for placeholders {missing} in template: {template}")
+    return [
+        dict(zip(fields, values))
+        for values in itertools.product(*(fills[field] for field in fields))
+    ]
+
+
+def _perturbed_groups(template: str, fills: dict[str, list[str]], perturb: str) -> list[list[str]]:
+    """One group of reviews per combination of the other placeholders, varying only perturb"""
+    if perturb not in fills:
+        raise ValueError(f"No fills for perturbed placeholder {perturb}")
+    # Pin perturb to a single dummy value so only the other placeholders are expanded
+    context_fills = {**fills, perturb: [""]}
+    return [
+        [
+            template.format(**{**values, perturb: value})
+            for value in fills[perturb]
+        ]
+        for values in expand_template(template, context_fills)
+    ]
+
+
+class ExpandedCase(BaseModel):
+    name: str
+    category: Literal["invariance", "directional", "mft"]
+    # For invariance and directional cases the first review is the baseline
+    reviews: list[str]
+    label: SentimentLabel | None = None
+    direction: SentimentLabel | None = None
+    tolerance: float = 0.0
+
+    def passes(self, probas: np.ndarray) -> bool:
+        """Check the expectation given the (len(reviews), n_classes) probabilities"""
+        predicted = probas.argmax(axis=1)
+        if self.category == "invariance" and not (predicted == predicted[0]).all():
+            return False
+        if self.category == "directional":
+            direction = NAME_TO_LABEL_CLASS[self.direction]
+            if (probas[1:, direction] < probas[0, direction] - self.tolerance).any():
+                return False
+            # The expected label only applies to the perturbed reviews
+            predicted = predicted[1:]
+        if self.label is not None:
+            return bool((predicted == NAME_TO_LABEL_CLASS[self.label]).all())
+        return True
+
+
+class MFTCase(BaseModel):
+    """Minimum Functionality Test, every expansion must be predicted as label"""
+    name: str
+    template: str
+    fills: dict[str, list[str]]
+    label: SentimentLabel
+
+    def expand(self) -> list[ExpandedCase]:
+        return [
+            ExpandedCase(
+                name=self.name,
+                category="mft",
+                reviews=[self.template.format(**values)],
+                label=self.label,
+            )
+            for values in expand_template(self.template, self.fills)
+        ]
+
+
+class InvarianceCase(BaseModel):
+    """INVariance, swapping the values of perturb must not change the label"""
+    name: str
+    template: str
+    fills: dict[str, list[str]]
+    perturb: str
+    label: SentimentLabel | None = None
+
+    def expand(self) -> list[ExpandedCase]:
+        return [
+            ExpandedCase(name=self.name, category="invariance", reviews=reviews, label=self.label)
+            for reviews in _perturbed_groups(self.template, self.fills, self.perturb)
+        ]
+
+
+class DirectionalCase(BaseModel):
+    """DIRectional expectation, the first value of perturb is the baseline and every
+    other value must not lower the probability of direction (nor miss label, if given)"""
+    name: str
+    template: str
+    fills: dict[str, list[str]]
+    perturb: str
+    direction: SentimentLabel
+    label: SentimentLabel | None = None
+    tolerance: float = 0.0
+
+    def expand(self) -> list[ExpandedCase]:
+        return [
+            ExpandedCase(
+                name=self.name,
+                category="directional",
+                reviews=reviews,
+                label=self.label,
+                direction=self.direction,
+                tolerance=self.tolerance,
+            )
+            for reviews in _perturbed_groups(self.template, self.fills, self.perturb)
+        ]
+
+
+@ray.remote
+def _score_shard(model: bytes, reviews: list[str]) -> np.ndarray:
+    options = rt.SessionOptions()
+    # One task per core, so keep onnxruntime from spawning its own thread pool
+    options.intra_op_num_threads = 1
+    options.inter_op_num_threads = 1
+    session = rt.InferenceSession(model, options, providers=["CPUExecutionProvider"])
+    return Model.predict_batch(session, reviews)
+
+
+def score_reviews(model: bytes, reviews: list[str], num_shards: int = 1) -> np.ndarray:
+    """Class probabilities for every review, in input order.
+
+    Scoring runs in-process by default. With num_shards > 1 the reviews are split
+    across that many Ray tasks, one core each. That only pays off for models far
+    heavier than TF-IDF/logistic regression, which score hundreds of thousands of
+    reviews per second in-process while Ray task startup costs seconds.
+    """
+    num_shards = min(num_shards, len(reviews))
+    if num_shards <= 1:
+        session = rt.InferenceSession(model, providers=["CPUExecutionProvider"])
+        return Model.predict_batch(session, reviews)
+
+    model_ref = ray.put(model)
+    shards = [
+        _score_shard.remote(model_ref, list(shard))
+        for shard in np.array_split(np.array(reviews, dtype=object), num_shards)
+    ]
+    return np.concatenate(ray.get(shards))
+
+
+def evaluate(
+    model_version: str,
+    cases: list[ExpandedCase],
+    probas: np.ndarray,
+    index: dict[str, int],
+    max_examples: int = 5,
+) -> list[BehavioralCategoryResult]:
+    """Per-category failure rates given the probabilities of every unique review"""
+    totals: dict[str, int] = defaultdict(int)
+    failures: dict[str, list[BehavioralFailure]] = defaultdict(list)
+    for case in cases:
+        totals[case.category] += 1
+        case_probas = probas[[index[review] for review in case.reviews]]
+        if not case.passes(case_probas):
+            failures[case.category].append(
+                BehavioralFailure(
+                    name=case.name,
+                    reviews=case.reviews,
+                    predicted=[LABEL_CLASS_TO_NAME[int(i)] for i in case_probas.argmax(axis=1)],
+                )
+            )
+
+    return [
+        BehavioralCategoryResult(
+            model_version=model_version,
+            category=category,
+            total=total,
+            failures=len(failures[category]),
+            failure_rate=len(failures[category]) / total,
+            examples=failures[category][:max_examples],
+        )
+        for category, total in sorted(totals.items())
+    ]
+
+
+def run_suite(
+    suite: list[MFTCase | InvarianceCase | DirectionalCase],
+    models: dict[str, bytes],
+    num_shards: int = 1,
+) -> BehavioralReport:
+    """Expand the suite, score each unique review once per model and report failure rates.
+
+    models maps a model version (e.g. "english_v1") to its serialized ONNX model.
+    """
+    cases = [case for spec in suite for case in spec.expand()]
+    reviews = list(dict.fromkeys(review for case in cases for review in case.reviews))
+    index = {review: i for i, review in enumerate(reviews)}
+
+    results = []
+    for model_version, model in models.items():
+        probas = score_reviews(model, reviews, num_shards=num_shards)
+        results.extend(evaluate(model_version, cases, probas, index))
+    return BehavioralReport(num_reviews=len(reviews), results=results)
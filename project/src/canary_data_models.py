@@ -46,4 +46,92 @@ class SimpleModelResponse(BaseModel):
             "label": highest_label,
             "score": scores[highest_label],
             "model_version": data.get("model_version", "unknown")
-        }
\ No newline at end of file
+        }
+
+class HeapAllocation(BaseModel):
+    location: str
+    size_bytes: int
+    count: int
+
+class ReplicaProfile(BaseModel):
+    deployment: str
+    replica_id: str
+    pid: int
+    reported_at: float
+    uptime_s: float
+    requests: int
+    heap_traced: bool
+    rss_bytes: int
+    rss_peak_bytes: int
+    python_heap_bytes: int
+    python_heap_peak_bytes: int
+    top_allocations: list[HeapAllocation]
+    onnx_session_load_bytes: int
+    # Largest RSS growth still held once a run returned, scratch memory freed
+    # inside the run is not seen, so this is not a peak
+    onnx_inference_rss_growth_max_bytes: int
+    cpu_utilization: float
+    cpu_utilization_p95: float
+    event_loop_lag_ms_p50: float
+    event_loop_lag_ms_p95: float
+    event_loop_lag_ms_max: float
+
+class CpuProfileStack(BaseModel):
+    stack: str
+    count: int
+
+class CpuProfile(BaseModel):
+    deployment: str
+    replica_id: str
+    duration_s: float
+    interval_s: float
+    samples: int
+    stacks: list[CpuProfileStack]
+
+class ActorOptions(BaseModel):
+    num_cpus: float
+    memory: int
+
+class SizingRecommendation(BaseModel):
+    deployment: str
+    replicas_observed: int
+    observed_rss_peak_bytes: int
+    observed_cpu_utilization_p95: float
+    observed_event_loop_lag_ms_p95: float
+    ray_actor_options: ActorOptions
+    notes: list[str]
+
+class BehavioralFailure(BaseModel):
+    name: str
+    reviews: list[str]
+    predicted: list[SentimentLabel]
+
+    model_config = ConfigDict(use_enum_values=True)
+
+class BehavioralCategoryResult(BaseModel):
+    model_version: str
+    category: str
+    total: int
+    failures: int
+    failure_rate: float
+    examples: list[BehavioralFailure]
+
+class BehavioralReport(BaseModel):
+    num_reviews: int
+    results: list[BehavioralCategoryResult]
+
+    def failure_rate(self, model_version: str, category: str) -> float:
+        for result in self.results:
+            if result.model_version == model_version and result.category == category:
+                return result.failure_rate
+        raise KeyError(f"No {category} results for {model_version}")
+
+    def summary(self) -> str:
+        lines = [f"{'model_version':<14} {'category':<12} {'failures':>12} {'rate':>8}"]
+        for result in self.results:
+            failures = f"{result.failures}/{result.total}"
+            lines.append(
+                f"{result.model_version:<14} {result.category:<12} "
+                f"{failures:>12} {result.failure_rate:>8.1%}"
+            )
+        return "\n".join(lines)
@@ -5,6 +5,7 @@ import os
 from typing import Literal, Dict
 
 from src.constants import (
+    LABEL_CLASS_TO_NAME,
     WANDB_API_KEY,
     OLD_MODEL_NAME,
     NEW_MODEL_NAME
@@ -13,7 +14,7 @@ from src.constants import (
 
 class Model:
     @classmethod
-    def load_model(cls, model_version: Literal["old", "new"] = "old") -> rt.InferenceSession:
+    def download_model(cls, model_version: Literal["old", "new"] = "old") -> str:
         if WANDB_API_KEY is None:
             raise ValueError(
                 "WANDB_API_KEY not set, unable to pull the model!",
@@ -29,11 +30,14 @@ class Model:
             reinit=True
         )
 
-        downloaded_model_path = run.use_model(
+        return run.use_model(
             name=model_name,
         )
+
+    @classmethod
+    def load_model(cls, model_version: Literal["old", "new"] = "old") -> rt.InferenceSession:
         return rt.InferenceSession(
-            downloaded_model_path, providers=["CPUExecutionProvider"]
+            cls.download_model(model_version), providers=["CPUExecutionProvider"]
         )
 
     @classmethod
@@ -44,4 +48,22 @@ class Model:
             _, probas = session.run(None, {input_name: np.array([[review]])})
 
             # Just convert raw probabilities to dictionary
-            return {i: float(prob) for i, prob in enumerate(probas[0])}
\ No newline at end of file
+            return {i: float(prob) for i, prob in enumerate(probas[0])}
+
+    @classmethod
+    def predict_batch(
+            cls, session: rt.InferenceSession, reviews: list[str], batch_size: int = 4096
+        ) -> np.ndarray:
+            """Class probabilities for many reviews, shape (len(reviews), n_classes)"""
+            input_name = session.get_inputs()[0].name
+            batches = []
+            for start in range(0, len(reviews), batch_size):
+                batch = np.array(reviews[start:start + batch_size]).reshape(-1, 1)
+                _, probas = session.run(None, {input_name: batch})
+                # Classifiers exported with a ZipMap return one {class: proba} dict per row
+                if len(probas) and isinstance(probas[0], dict):
+                    probas = [[row[label] for label in sorted(row)] for row in probas]
+                batches.append(np.asarray(probas, dtype=np.float32))
+            if not batches:
+                return np.empty((0, len(LABEL_CLASS_TO_NAME)), dtype=np.float32)
+            return np.concatenate(batches)
@@ -1,5 +1,5 @@
 import random
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, HTTPException, Request
 from ray import serve
 from ray.serve.handle import DeploymentHandle
 from loguru import logger
@@ -7,9 +7,17 @@ import time
 import uuid
 from datetime import datetime
 
-from src.canary_data_models import SimpleModelRequest, SimpleModelResponse, SimpleModelResults
+from src.canary_data_models import (
+    CpuProfile,
+    ReplicaProfile,
+    SimpleModelRequest,
+    SimpleModelResponse,
+    SimpleModelResults,
+    SizingRecommendation,
+)
 from src.constants import CANARY_PERCENT
 from src.canary_model import Model
+from src.profiling import ReplicaProfiler, recommend_actor_options
 
 app = FastAPI(
     title="Drug Review Sentiment Analysis",
@@ -49,9 +57,11 @@ async def log_and_inject_metadata(request: Request, call_next):
 class SimpleModel:
     def __init__(self, model_version: str = "english_v1") -> None:
         self.logger = configure_logger("model.log")
-        self.session = Model.load_model(
-            "old" if model_version == "english_v1" else "new"
-        )
+        self.profiler = ReplicaProfiler(f"SimpleModel:{model_version}")
+        with self.profiler.track_onnx_load():
+            self.session = Model.load_model(
+                "old" if model_version == "english_v1" else "new"
+            )
         self.model_version = model_version
         self.logger.info(f"SimpleModel initialized with version: {model_version}")
 
@@ -59,7 +69,8 @@ class SimpleModel:
         self.logger.info(f"[{self.model_version}] Predicting sentiment for review: {review}")
         try:
             # Get prediction from model
-            raw_probs = Model.predict(self.session, review)
+            with self.profiler.track_inference():
+                raw_probs = Model.predict(self.session, review)
 
             # Add model version to raw probabilities
             raw_probs["model_version"] = self.model_version
@@ -73,6 +84,9 @@ class SimpleModel:
             self.logger.error(f"[{self.model_version}] Error during prediction: {str(e)}")
             raise
 
+    async def cpu_profile(self, duration_s: float) -> CpuProfile:
+        return await self.profiler.cpu_profile(duration_s)
+
 @serve.deployment(
     ray_actor_options={"num_cpus": 0.2},
     autoscaling_config={"min_replicas": 1, "max_replicas": 2},
@@ -86,6 +100,7 @@ class Canary:
         self.canary_percent = canary_percent
         self.request_count = 0
         self.canary_count = 0
+        self.profiler = ReplicaProfiler("Canary")
         self.logger.info(f"Canary initialized with {canary_percent*100}% traffic to new model")
 
     async def predict(self, request: SimpleModelRequest) -> SimpleModelResponse:
@@ -117,6 +132,13 @@ class Canary:
             self.logger.error(f"Error in canary routing: {str(e)}")
             raise
 
+    async def cpu_profile(self, target: str, duration_s: float) -> CpuProfile:
+        """Sample a CPU profile on this replica or forward it to one of the models"""
+        if target == "canary":
+            return await self.profiler.cpu_profile(duration_s)
+        model = self.new_model if target == "new" else self.old_model
+        return await model.cpu_profile.remote(duration_s)
+
 @serve.deployment(
     ray_actor_options={"num_cpus": 0.2},
     autoscaling_config={"min_replicas": 1, "max_replicas": 2},
@@ -128,6 +150,7 @@ class APIIngress:
         self.logger = configure_logger("api.log")
         self.logger.info("APIIngress initialized with canary routing")
         self.handle = canary_handle
+        self.profiler = ReplicaProfiler("APIIngress")
 
     @app.post("/predict")
     async def predict(self, request: SimpleModelRequest):
@@ -140,6 +163,43 @@ class APIIngress:
             self.logger.error(f"Error during prediction: {str(e)}")
             raise
 
+    def _require_profiling(self) -> None:
+        if not self.profiler.enabled:
+            raise HTTPException(
+                status_code=404,
+                detail="Profiling is disabled, restart the app with PROFILING_ENABLED=1",
+            )
+
+    @app.get("/admin/profile")
+    async def profile(self) -> list[ReplicaProfile]:
+        """Latest memory/CPU profile of every replica of every deployment"""
+        self._require_profiling()
+        await self.profiler.report()
+        return await self.profiler.collect_profiles()
+
+    @app.get("/admin/profile/cpu")
+    async def cpu_profile(self, target: str = "ingress", duration_s: float = 5.0) -> CpuProfile:
+        """On-demand sampling CPU profile of one replica of the target deployment"""
+        self._require_profiling()
+        if target not in ("ingress", "canary", "old", "new"):
+            raise HTTPException(
+                status_code=400,
+                detail="target must be one of: ingress, canary, old, new",
+            )
+        if not 0 < duration_s <= 60:
+            raise HTTPException(status_code=400, detail="duration_s must be in (0, 60]")
+        self.logger.info(f"Sampling CPU profile of {target} for {duration_s}s")
+        if target == "ingress":
+            return await self.profiler.cpu_profile(duration_s)
+        return await self.handle.cpu_profile.remote(target, duration_s)
+
+    @app.get("/admin/sizing")
+    async def sizing(self) -> list[SizingRecommendation]:
+        """Recommended ray_actor_options per deployment from the observed profiles"""
+        self._require_profiling()
+        await self.profiler.report()
+        return recommend_actor_options(await self.profiler.collect_profiles())
+
 old_model = SimpleModel.bind(model_version="english_v1")
 new_model = SimpleModel.bind(model_version="french_v1")
 canary = Canary.bind(old_model, new_model, canary_percent=CANARY_PERCENT)
@@ -34,3 +34,13 @@ CANARY_PERCENT = 0.2  # 20% traffic to new model
 # Ensure that you set the API Key within Github Codespaces secrets
 # in the settings page of your repository!
 WANDB_API_KEY = os.getenv("WANDB_API_KEY")
+
+
+# Per-replica profiling (opt-in), enable with PROFILING_ENABLED=1 before `serve run`
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "0") == "1"
+# tracemalloc adds its own memory and CPU overhead, so keep it off for sizing runs
+PROFILING_TRACE_HEAP = os.getenv("PROFILING_TRACE_HEAP", "0") == "1"
+PROFILING_COLLECTOR_NAME = "replica_profile_collector"
+PROFILING_REPORT_INTERVAL_S = float(os.getenv("PROFILING_REPORT_INTERVAL_S", "10"))
+PROFILING_LAG_PROBE_INTERVAL_S = 0.1
+PROFILING_TRACEMALLOC_TOP_N = 10
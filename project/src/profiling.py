@@ -0,0 +1,405 @@
+import asyncio
+import math
+import os
+import resource
+import statistics
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter, defaultdict, deque
+from contextlib import contextmanager
+from typing import Iterator
+
+import ray
+from loguru import logger
+from ray import serve
+from ray.exceptions import RayError
+from ray.serve.exceptions import RayServeException
+
+from src.canary_data_models import (
+    ActorOptions,
+    CpuProfile,
+    CpuProfileStack,
+    HeapAllocation,
+    ReplicaProfile,
+    SizingRecommendation,
+)
+from src.constants import (
+    PROFILING_COLLECTOR_NAME,
+    PROFILING_ENABLED,
+    PROFILING_LAG_PROBE_INTERVAL_S,
+    PROFILING_REPORT_INTERVAL_S,
+    PROFILING_TRACE_HEAP,
+    PROFILING_TRACEMALLOC_TOP_N,
+)
+
+MIB = 1024 * 1024
+# Leaf functions of threads parked on a lock, queue or selector rather than running,
+# including Serve's user-code event loop thread sitting in uvloop's native run_forever
+IDLE_LEAF_FUNCTIONS = {
+    "wait", "get", "select", "poll", "epoll", "main_loop", "run_forever",
+    "run_until_complete", "_worker", "accept", "_run_user_code_event_loop",
+}
+
+
+def current_rss_bytes() -> int:
+    """Resident set size of this process, falling back to the peak off Linux."""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return peak_rss_bytes()
+
+
+def peak_rss_bytes() -> int:
+    """Lifetime peak RSS of this process (ru_maxrss is KiB on Linux, bytes on macOS)."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _percentile(values: list[float], percent: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, math.ceil(percent / 100 * len(ordered)) - 1)
+    return ordered[max(index, 0)]
+
+
+def _collapse_stack(frame) -> str | None:
+    """Render a frame as a root-to-leaf collapsed stack (flamegraph.pl format),
+    or None if the thread is blocked waiting rather than running"""
+    if frame.f_code.co_name in IDLE_LEAF_FUNCTIONS:
+        return None
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+def _thread_cpu_time(thread_id: int) -> float | None:
+    """CPU time consumed by a thread, None where per-thread clocks are unsupported"""
+    try:
+        return time.clock_gettime(time.pthread_getcpuclockid(thread_id))
+    except (AttributeError, OSError):
+        return None
+
+
+def _replica_id(deployment: str) -> str:
+    try:
+        return serve.get_replica_context().replica_tag
+    except RayServeException:
+        # Outside of a Serve replica (e.g. unit tests)
+        return f"{deployment}#{os.getpid()}"
+
+
+@ray.remote(num_cpus=0)
+class ProfileCollector:
+    """Named actor holding the latest profile pushed by every replica"""
+    def __init__(self) -> None:
+        self.profiles: dict[str, dict] = {}
+
+    def report(self, profile: dict) -> None:
+        self.profiles[profile["replica_id"]] = profile
+
+    def snapshot(self, max_age_s: float) -> list[dict]:
+        # Replicas that stopped reporting have been scaled down or died
+        cutoff = time.time() - max_age_s
+        self.profiles = {
+            replica_id: profile
+            for replica_id, profile in self.profiles.items()
+            if profile["reported_at"] >= cutoff
+        }
+        return list(self.profiles.values())
+
+
+def get_collector():
+    return ProfileCollector.options(
+        name=PROFILING_COLLECTOR_NAME,
+        lifetime="detached",
+        get_if_exists=True,
+    ).remote()
+
+
+class ReplicaProfiler:
+    """Opt-in memory/CPU instrumentation for a single Serve replica.
+
+    When disabled every hook is a no-op, so deployments can call it unconditionally.
+    The defaults are read in the replica's own process: the ingress class is pickled by
+    value, so flags imported into canary_server would carry the driver's environment.
+    """
+    def __init__(
+        self,
+        deployment: str,
+        enabled: bool = PROFILING_ENABLED,
+        trace_heap: bool = PROFILING_TRACE_HEAP,
+        top_n: int = PROFILING_TRACEMALLOC_TOP_N,
+        report_interval_s: float = PROFILING_REPORT_INTERVAL_S,
+        lag_probe_interval_s: float = PROFILING_LAG_PROBE_INTERVAL_S,
+    ) -> None:
+        self.deployment = deployment
+        self.enabled = enabled
+        self.trace_heap = enabled and trace_heap
+        self.replica_id = _replica_id(deployment)
+        self.top_n = top_n
+        self.report_interval_s = report_interval_s
+        self.lag_probe_interval_s = lag_probe_interval_s
+
+        self.requests = 0
+        self.rss_peak_bytes = 0
+        self.onnx_session_load_bytes = 0
+        self.onnx_inference_rss_growth_max_bytes = 0
+        self.lag_ms: deque[float] = deque(maxlen=1000)
+        self.cpu_utilization: deque[float] = deque(maxlen=360)
+        self.started_at = time.time()
+        self._cpu_mark = (time.monotonic(), time.process_time())
+        self._monitor_task: asyncio.Task | None = None
+        # Resolving the named actor is a blocking GCS lookup, so do it once per replica
+        self._collector = None
+        # Threads that run this replica's user code, the only ones worth sampling
+        self._user_threads: set[int] = set()
+
+        if not enabled:
+            return
+        if self.trace_heap and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self.rss_peak_bytes = current_rss_bytes()
+        self.ensure_monitor()
+
+    def ensure_monitor(self) -> None:
+        """Start the event-loop lag/reporting task once a running loop is available"""
+        if not self.enabled:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Sync constructor outside the replica loop, retried on the next async call
+            return
+        self._user_threads.add(threading.get_ident())
+        if self._monitor_task is None:
+            self._monitor_task = loop.create_task(self._monitor())
+
+    @contextmanager
+    def track_onnx_load(self) -> Iterator[None]:
+        """Attribute the RSS growth while creating an ONNX session to its arenas"""
+        if not self.enabled:
+            yield
+            return
+        before = current_rss_bytes()
+        yield
+        after = current_rss_bytes()
+        self.onnx_session_load_bytes += max(after - before, 0)
+        self.rss_peak_bytes = max(self.rss_peak_bytes, after)
+
+    @contextmanager
+    def track_inference(self) -> Iterator[None]:
+        """Record request count and the RSS growth across an ONNX run, read after it returns"""
+        if not self.enabled:
+            yield
+            return
+        self.ensure_monitor()
+        # Sync methods may run on an executor thread instead of the event loop
+        self._user_threads.add(threading.get_ident())
+        before = current_rss_bytes()
+        yield
+        after = current_rss_bytes()
+        self.requests += 1
+        self.onnx_inference_rss_growth_max_bytes = max(
+            self.onnx_inference_rss_growth_max_bytes, after - before
+        )
+        self.rss_peak_bytes = max(self.rss_peak_bytes, after)
+
+    def _mark_cpu(self) -> None:
+        wall, cpu = time.monotonic(), time.process_time()
+        last_wall, last_cpu = self._cpu_mark
+        if wall > last_wall:
+            # Fraction of one core used since the previous mark, i.e. comparable to num_cpus
+            self.cpu_utilization.append((cpu - last_cpu) / (wall - last_wall))
+        self._cpu_mark = (wall, cpu)
+
+    async def _monitor(self) -> None:
+        next_report = time.monotonic() + self.report_interval_s
+        while True:
+            start = time.monotonic()
+            await asyncio.sleep(self.lag_probe_interval_s)
+            lag = time.monotonic() - start - self.lag_probe_interval_s
+            self.lag_ms.append(max(lag, 0.0) * 1000)
+            self.rss_peak_bytes = max(self.rss_peak_bytes, current_rss_bytes())
+
+            if time.monotonic() >= next_report:
+                next_report = time.monotonic() + self.report_interval_s
+                # Only these fixed-interval windows count towards CPU utilization: ad-hoc
+                # reports from admin requests would add short windows measured while busy
+                self._mark_cpu()
+                await self.report()
+
+    async def report(self) -> None:
+        """Push a fresh snapshot to the cluster-wide collector"""
+        if not self.enabled:
+            return
+        self.ensure_monitor()
+        try:
+            collector = self._get_collector()
+            await collector.report.remote(self.snapshot().model_dump())
+        except RayError as e:
+            # The collector may have died, look it up again on the next report
+            self._collector = None
+            logger.warning(f"[{self.deployment}] Unable to report profile: {str(e)}")
+
+    async def collect_profiles(self, max_age_s: float | None = None) -> list[ReplicaProfile]:
+        """Latest profile of every live replica, across all deployments"""
+        if max_age_s is None:
+            max_age_s = 3 * self.report_interval_s
+        collector = self._get_collector()
+        try:
+            profiles = await collector.snapshot.remote(max_age_s)
+        except RayError:
+            self._collector = None
+            raise
+        return [ReplicaProfile.model_validate(profile) for profile in profiles]
+
+    def _get_collector(self):
+        if self._collector is None:
+            self._collector = get_collector()
+        return self._collector
+
+    def _top_allocations(self) -> list[HeapAllocation]:
+        statistics_by_line = tracemalloc.take_snapshot().statistics("lineno")
+        return [
+            HeapAllocation(
+                location=str(stat.traceback[0]),
+                size_bytes=stat.size,
+                count=stat.count,
+            )
+            for stat in statistics_by_line[: self.top_n]
+        ]
+
+    def snapshot(self) -> ReplicaProfile:
+        rss = current_rss_bytes()
+        self.rss_peak_bytes = max(self.rss_peak_bytes, rss, peak_rss_bytes())
+        heap, heap_peak = tracemalloc.get_traced_memory() if self.trace_heap else (0, 0)
+        lag_ms = list(self.lag_ms)
+        cpu_utilization = list(self.cpu_utilization)
+
+        return ReplicaProfile(
+            deployment=self.deployment,
+            replica_id=self.replica_id,
+            pid=os.getpid(),
+            reported_at=time.time(),
+            uptime_s=time.time() - self.started_at,
+            requests=self.requests,
+            heap_traced=self.trace_heap,
+            rss_bytes=rss,
+            rss_peak_bytes=self.rss_peak_bytes,
+            python_heap_bytes=heap,
+            python_heap_peak_bytes=heap_peak,
+            top_allocations=self._top_allocations() if self.trace_heap else [],
+            onnx_session_load_bytes=self.onnx_session_load_bytes,
+            onnx_inference_rss_growth_max_bytes=self.onnx_inference_rss_growth_max_bytes,
+            cpu_utilization=cpu_utilization[-1] if cpu_utilization else 0.0,
+            cpu_utilization_p95=_percentile(cpu_utilization, 95),
+            event_loop_lag_ms_p50=statistics.median(lag_ms) if lag_ms else 0.0,
+            event_loop_lag_ms_p95=_percentile(lag_ms, 95),
+            event_loop_lag_ms_max=max(lag_ms, default=0.0),
+        )
+
+    def sample_cpu(self, duration_s: float, interval_s: float = 0.005) -> CpuProfile:
+        """Sampling profile of the threads running user code, skipping samples where
+        they are blocked waiting so only on-CPU stacks are counted"""
+        stacks: Counter[str] = Counter()
+        cpu_marks: dict[int, float | None] = {}
+        samples = 0
+        deadline = time.monotonic() + duration_s
+        while time.monotonic() < deadline:
+            frames = sys._current_frames()
+            for thread_id in self._user_threads & frames.keys():
+                cpu, last_cpu = _thread_cpu_time(thread_id), cpu_marks.get(thread_id)
+                cpu_marks[thread_id] = cpu
+                # A thread whose CPU clock did not advance since the last sample was off-CPU
+                if cpu is not None and (last_cpu is None or cpu <= last_cpu):
+                    continue
+                stack = _collapse_stack(frames[thread_id])
+                if stack is not None:
+                    stacks[stack] += 1
+            samples += 1
+            time.sleep(interval_s)
+
+        return CpuProfile(
+            deployment=self.deployment,
+            replica_id=self.replica_id,
+            duration_s=duration_s,
+            interval_s=interval_s,
+            samples=samples,
+            stacks=[
+                CpuProfileStack(stack=stack, count=count)
+                for stack, count in stacks.most_common(50)
+            ],
+        )
+
+    async def cpu_profile(self, duration_s: float) -> CpuProfile:
+        # Sample from a worker thread so the replica's event loop is profiled, not blocked
+        self.ensure_monitor()
+        return await asyncio.to_thread(self.sample_cpu, duration_s)
+
+
+def _round_up(value: float, step: float) -> float:
+    return math.ceil(value / step) * step
+
+
+def recommend_actor_options(
+    profiles: list[ReplicaProfile],
+    memory_headroom: float = 1.25,
+    cpu_headroom: float = 1.2,
+    min_num_cpus: float = 0.05,
+    lag_warning_ms: float = 50.0,
+) -> list[SizingRecommendation]:
+    """Recommend ray_actor_options per deployment from observed replica profiles.
+
+    Memory is the worst replica's peak RSS plus headroom, rounded up to 64 MiB;
+    num_cpus is the worst replica's p95 CPU utilization plus headroom, in 0.05 steps.
+    """
+    by_deployment: dict[str, list[ReplicaProfile]] = defaultdict(list)
+    for profile in profiles:
+        by_deployment[profile.deployment].append(profile)
+
+    recommendations = []
+    for deployment, replicas in sorted(by_deployment.items()):
+        rss_peak = max(replica.rss_peak_bytes for replica in replicas)
+        cpu_p95 = max(replica.cpu_utilization_p95 for replica in replicas)
+        lag_p95 = max(replica.event_loop_lag_ms_p95 for replica in replicas)
+
+        notes = []
+        if any(replica.heap_traced for replica in replicas):
+            notes.append(
+                "Measured with PROFILING_TRACE_HEAP=1, memory and CPU include tracemalloc "
+                "overhead: re-run without it for sizing"
+            )
+        if sum(replica.requests for replica in replicas) == 0 and any(
+            replica.onnx_session_load_bytes for replica in replicas
+        ):
+            notes.append("No inference requests observed, run a load test before sizing")
+        if lag_p95 > lag_warning_ms:
+            notes.append(
+                f"Event loop lag p95 {lag_p95:.1f}ms, replica is CPU-starved: "
+                "raise num_cpus or max_replicas"
+            )
+
+        recommendations.append(
+            SizingRecommendation(
+                deployment=deployment,
+                replicas_observed=len(replicas),
+                observed_rss_peak_bytes=rss_peak,
+                observed_cpu_utilization_p95=cpu_p95,
+                observed_event_loop_lag_ms_p95=lag_p95,
+                ray_actor_options=ActorOptions(
+                    num_cpus=round(
+                        max(_round_up(cpu_p95 * cpu_headroom, 0.05), min_num_cpus), 2
+                    ),
+                    memory=int(_round_up(rss_peak * memory_headroom, 64 * MIB)),
+                ),
+                notes=notes,
+            )
+        )
+    return recommendations
@@ -1,23 +1,40 @@
+import sys
+from types import SimpleNamespace
+from unittest import mock
+
 import pytest
 import ray
+import ray.cloudpickle
 from ray import serve
 
+from src import canary_server
+from src.canary_model import Model
 from src.server import APIIngress, SimpleModel
 
+# conftest is not importable from Serve replicas, ship the stubs below by value
+ray.cloudpickle.register_pickle_by_value(sys.modules[__name__])
+
 
 @pytest.fixture(scope="session")
-def ray_serve():
+def ray_cluster():
     try:
         ray.init(
             # Suggested to hard code num_cpus from docs:
             # https://docs.ray.io/en/latest/ray-core/examples/testing-tips.html#tip-1-fixing-the-resource-quantity-with-ray-init-num-cpus
-            num_cpus=1,
+            # Serve deployments in these tests reserve no CPUs, test_score_reviews_sharded
+            # runs one Ray task per CPU
+            num_cpus=4,
         )
-        yield serve.start(detached=True, http_options={"host": "0.0.0.0"})
+        yield
     finally:
         ray.shutdown()
 
 
+@pytest.fixture(scope="session")
+def ray_serve(ray_cluster):
+    yield serve.start(detached=True, http_options={"host": "0.0.0.0"})
+
+
 @pytest.fixture(scope="session")
 def ray_serve_app(ray_serve):
     serve.run(
@@ -31,3 +48,66 @@ def ray_serve_app(ray_serve):
 @pytest.fixture
 def predict_url(ray_serve_app):
     return "http://127.0.0.1:8000/predict"
+
+
+@pytest.fixture(scope="session")
+def canary_models():
+    """Serialized ONNX models of both canary versions, keyed by model version"""
+    models = {}
+    for model_version, registry_version in [("english_v1", "old"), ("french_v1", "new")]:
+        with open(Model.download_model(registry_version), "rb") as f:
+            models[model_version] = f.read()
+    return models
+
+
+class StubSession:
+    """Stands in for the ONNX session so canary apps can run without pulling models"""
+    def get_inputs(self):
+        return [SimpleNamespace(name="input")]
+
+    def run(self, output_names, input_feed):
+        return None, [[0.1, 0.2, 0.7]]
+
+
+class StubbedSimpleModel(canary_server.SimpleModel.func_or_class):
+    def __init__(self, model_version: str = "english_v1") -> None:
+        with mock.patch.object(Model, "load_model", return_value=StubSession()):
+            super().__init__(model_version)
+
+
+def run_stubbed_canary_app(name, env_vars):
+    ray_actor_options = {"num_cpus": 0, "runtime_env": {"env_vars": env_vars}}
+    old_model, new_model = (
+        canary_server.SimpleModel.options(
+            # Explicit names, the stub class would otherwise give both the same one
+            name=f"SimpleModel_{model_version}",
+            func_or_class=StubbedSimpleModel,
+            ray_actor_options=ray_actor_options,
+        ).bind(model_version=model_version)
+        for model_version in ("english_v1", "french_v1")
+    )
+    serve.run(
+        canary_server.APIIngress.options(ray_actor_options=ray_actor_options).bind(
+            canary_server.Canary.options(ray_actor_options=ray_actor_options).bind(
+                old_model,
+                new_model,
+                canary_percent=0.5,
+            )
+        ),
+        name=name,
+        route_prefix=f"/{name}",
+    )
+    return f"http://127.0.0.1:8000/{name}"
+
+
+@pytest.fixture(scope="session")
+def profiled_canary_url(ray_serve):
+    return run_stubbed_canary_app(
+        "profiled_canary",
+        {"PROFILING_ENABLED": "1", "PROFILING_REPORT_INTERVAL_S": "1"},
+    )
+
+
+@pytest.fixture(scope="session")
+def canary_url(ray_serve):
+    return run_stubbed_canary_app("canary", {"PROFILING_ENABLED": "0"})
@@ -0,0 +1,60 @@
+import time
+
+import pytest
+import requests
+
+DEPLOYMENTS = ["APIIngress", "Canary", "SimpleModel:english_v1", "SimpleModel:french_v1"]
+
+
+def test_admin_profile_aggregates_every_deployment(profiled_canary_url):
+    response = requests.post(f"{profiled_canary_url}/predict", json={"review": "This drug helped a lot."})
+    assert response.status_code == 200
+
+    # Replicas push their profile every PROFILING_REPORT_INTERVAL_S
+    deadline = time.time() + 60
+    while True:
+        response = requests.get(f"{profiled_canary_url}/admin/profile")
+        assert response.status_code == 200
+        deployments = sorted(profile["deployment"] for profile in response.json())
+        if deployments == DEPLOYMENTS or time.time() > deadline:
+            break
+        time.sleep(1)
+
+    assert deployments == DEPLOYMENTS
+    assert all(profile["rss_bytes"] > 0 for profile in response.json())
+
+
+def test_admin_sizing(profiled_canary_url):
+    response = requests.get(f"{profiled_canary_url}/admin/sizing")
+    assert response.status_code == 200
+    for recommendation in response.json():
+        assert isinstance(recommendation["ray_actor_options"]["memory"], int)
+        assert recommendation["ray_actor_options"]["num_cpus"] > 0
+
+
+def test_admin_cpu_profile(profiled_canary_url):
+    response = requests.get(
+        f"{profiled_canary_url}/admin/profile/cpu", params={"target": "old", "duration_s": 0.2}
+    )
+    assert response.status_code == 200
+    assert response.json()["deployment"] == "SimpleModel:english_v1"
+    assert response.json()["samples"] > 0
+
+
+@pytest.mark.parametrize(
+    "params",
+    [
+        {"target": "bogus"},
+        {"target": "old", "duration_s": 0},
+        {"target": "old", "duration_s": 120},
+    ],
+)
+def test_admin_cpu_profile_rejects_bad_params(profiled_canary_url, params):
+    response = requests.get(f"{profiled_canary_url}/admin/profile/cpu", params=params)
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize("route", ["/admin/profile", "/admin/profile/cpu", "/admin/sizing"])
+def test_admin_routes_404_when_profiling_disabled(canary_url, route):
+    response = requests.get(f"{canary_url}{route}")
+    assert response.status_code == 404
@@ -0,0 +1,172 @@
+import time
+
+import numpy as np
+import pytest
+
+from src.behavioral import (
+    DirectionalCase,
+    InvarianceCase,
+    MFTCase,
+    evaluate,
+    expand_template,
+    run_suite,
+    score_reviews,
+)
+from src.constants import SentimentLabel
+
+DRUGS = [
+    "This drug", "This medication", "This medicine", "This pill",
+    "This treatment", "This prescription", "The tablet", "My new medication",
+]
+DOSES = ["", " at a low dose", " at the prescribed dose"]
+CONDITIONS = [
+    "anxiety", "depression", "migraines", "back pain", "insomnia",
+    "acne", "blood pressure", "arthritis", "asthma", "nausea",
+]
+POSITIVE = [
+    "has worked wonders for", "really helped with", "significantly improved",
+    "completely cleared up", "made a huge difference for",
+]
+NEGATIVE = [
+    "did nothing for", "completely failed to help", "worsened",
+    "did not help with", "was useless for",
+]
+TIMES = ["", " after a week", " within days", " over the last month", " since I started"]
+
+# ~14k expanded cases, ~15k unique reviews scored per model
+SUITE = [
+    MFTCase(
+        name="positive outcome",
+        template="{drug}{dose} {verb} my {condition}{time}.",
+        fills={"drug": DRUGS, "dose": DOSES, "verb": POSITIVE, "condition": CONDITIONS, "time": TIMES},
+        label=SentimentLabel.POSITIVE,
+    ),
+    MFTCase(
+        name="negative outcome",
+        template="{drug}{dose} {verb} my {condition}{time}.",
+        fills={"drug": DRUGS, "dose": DOSES, "verb": NEGATIVE, "condition": CONDITIONS, "time": TIMES},
+        label=SentimentLabel.NEGATIVE,
+    ),
+    InvarianceCase(
+        name="drug synonyms",
+        template="{drug} {verb} my {condition}{time}.",
+        fills={"drug": DRUGS, "verb": POSITIVE + NEGATIVE, "condition": CONDITIONS, "time": TIMES},
+        perturb="drug",
+    ),
+    InvarianceCase(
+        name="condition names",
+        template="{drug} {verb} my {condition}{time}.",
+        fills={"drug": DRUGS, "verb": POSITIVE + NEGATIVE, "condition": CONDITIONS, "time": TIMES},
+        perturb="condition",
+    ),
+    DirectionalCase(
+        name="added side effects",
+        template="{drug} {verb} my {condition}.{suffix}",
+        fills={
+            "drug": DRUGS,
+            "verb": POSITIVE,
+            "condition": CONDITIONS,
+            "suffix": [
+                "",
+                " But the side effects were unbearable.",
+                " Unfortunately it stopped working after a month.",
+                " I had terrible headaches the whole time.",
+            ],
+        },
+        perturb="suffix",
+        direction=SentimentLabel.NEGATIVE,
+    ),
+    DirectionalCase(
+        name="added improvement",
+        template="{drug} {verb} my {condition} at first.{suffix}",
+        fills={
+            "drug": DRUGS,
+            "verb": NEGATIVE,
+            "condition": CONDITIONS,
+            "suffix": [
+                "",
+                " Now I feel much better though.",
+                " After raising the dose it works great.",
+                " It finally helped and I would recommend it.",
+            ],
+        },
+        perturb="suffix",
+        direction=SentimentLabel.POSITIVE,
+    ),
+]
+
+# Absolute ceiling per category, tighten as the models improve
+MAX_FAILURE_RATE = {"mft": 0.5, "invariance": 0.5, "directional": 0.5}
+# The canary model must not regress on any category by more than this
+MAX_CANARY_REGRESSION = 0.05
+
+
+def test_expand_template():
+    expanded = expand_template("{a} and {b}, {a}", {"a": ["1", "2"], "b": ["x", "y", "z"], "c": ["unused"]})
+    assert len(expanded) == 6
+    assert expanded[0] == {"a": "1", "b": "x"}
+
+    with pytest.raises(ValueError):
+        expand_template("{a} and {b}", {"a": ["1"]})
+
+
+def test_invariance_groups_only_vary_the_perturbed_placeholder():
+    case = InvarianceCase(
+        name="synonyms",
+        template="{drug} helped my {condition}.",
+        fills={"drug": ["This drug", "This pill"], "condition": ["acne", "asthma", "insomnia"]},
+        perturb="drug",
+    )
+    expanded = case.expand()
+    assert len(expanded) == 3
+    assert expanded[0].reviews == ["This drug helped my acne.", "This pill helped my acne."]
+
+
+def test_evaluate_failure_rates_per_category():
+    cases = [
+        *MFTCase(name="mft", template="{r}", fills={"r": ["a", "b"]}, label=SentimentLabel.POSITIVE).expand(),
+        *InvarianceCase(name="inv", template="{r}", fills={"r": ["a", "b"]}, perturb="r").expand(),
+        *DirectionalCase(
+            name="dir", template="{r}", fills={"r": ["a", "c"]}, perturb="r", direction=SentimentLabel.NEGATIVE
+        ).expand(),
+    ]
+    index = {"a": 0, "b": 1, "c": 2}
+    probas = np.array(
+        [
+            [0.1, 0.1, 0.8],  # a: POSITIVE
+            [0.7, 0.2, 0.1],  # b: NEGATIVE
+            [0.4, 0.2, 0.4],  # c: more NEGATIVE than a
+        ]
+    )
+    results = {result.category: result for result in evaluate("english_v1", cases, probas, index)}
+
+    assert results["mft"].failure_rate == 0.5
+    assert results["mft"].examples[0].predicted == ["NEGATIVE"]
+    assert results["invariance"].failures == 1
+    assert results["directional"].failures == 0
+
+
+def test_score_reviews_sharded(ray_cluster, canary_models):
+    model = canary_models["english_v1"]
+    # Positive then negative reviews, so shards returned out of order would not match
+    reviews = [case.reviews[0] for case in SUITE[0].expand()[:500] + SUITE[1].expand()[:500]]
+
+    in_process = score_reviews(model, reviews)
+    sharded = score_reviews(model, reviews, num_shards=4)
+
+    assert sharded.shape == (len(reviews), 3)
+    np.testing.assert_allclose(sharded, in_process, rtol=1e-6)
+
+
+def test_behavioral_suite(canary_models):
+    start = time.time()
+    report = run_suite(SUITE, canary_models)
+    print(f"\nScored {report.num_reviews} reviews per model in {time.time() - start:.2f}s")
+    print(report.summary())
+
+    for category, max_failure_rate in MAX_FAILURE_RATE.items():
+        old = report.failure_rate("english_v1", category)
+        new = report.failure_rate("french_v1", category)
+        assert old <= max_failure_rate
+        assert new <= max_failure_rate
+        assert new <= old + MAX_CANARY_REGRESSION
@@ -0,0 +1,198 @@
+import asyncio
+import threading
+import time
+import tracemalloc
+
+import pytest
+from ray.exceptions import RayError
+
+from src.canary_data_models import ReplicaProfile
+from src import profiling
+from src.profiling import MIB, ReplicaProfiler, recommend_actor_options
+
+
+def make_profile(deployment, replica_id, rss_peak_mib, cpu_p95, lag_p95=1.0, requests=100):
+    return ReplicaProfile(
+        deployment=deployment,
+        replica_id=replica_id,
+        pid=1,
+        reported_at=0.0,
+        uptime_s=60.0,
+        requests=requests,
+        heap_traced=False,
+        rss_bytes=rss_peak_mib * MIB,
+        rss_peak_bytes=rss_peak_mib * MIB,
+        python_heap_bytes=0,
+        python_heap_peak_bytes=0,
+        top_allocations=[],
+        onnx_session_load_bytes=40 * MIB,
+        onnx_inference_rss_growth_max_bytes=0,
+        cpu_utilization=cpu_p95,
+        cpu_utilization_p95=cpu_p95,
+        event_loop_lag_ms_p50=lag_p95,
+        event_loop_lag_ms_p95=lag_p95,
+        event_loop_lag_ms_max=lag_p95,
+    )
+
+
+def test_recommendation_uses_worst_replica_with_headroom():
+    [recommendation] = recommend_actor_options(
+        [
+            make_profile("SimpleModel:english_v1", "a", rss_peak_mib=200, cpu_p95=0.10),
+            make_profile("SimpleModel:english_v1", "b", rss_peak_mib=300, cpu_p95=0.30),
+        ]
+    )
+    assert recommendation.replicas_observed == 2
+    # 300 MiB * 1.25 = 375 MiB, rounded up to 384 MiB
+    assert recommendation.ray_actor_options.memory == 384 * MIB
+    # 0.30 * 1.2 = 0.36, rounded up to 0.4
+    assert recommendation.ray_actor_options.num_cpus == pytest.approx(0.4)
+    assert recommendation.notes == []
+
+
+def test_recommendation_flags_event_loop_lag_and_idle_models():
+    recommendations = recommend_actor_options(
+        [
+            make_profile("Canary", "c", rss_peak_mib=100, cpu_p95=0.0, lag_p95=120.0),
+            make_profile("SimpleModel:french_v1", "d", rss_peak_mib=100, cpu_p95=0.0, requests=0),
+        ]
+    )
+    canary, model = recommendations
+    assert canary.ray_actor_options.num_cpus == pytest.approx(0.05)
+    assert "lag" in canary.notes[0]
+    assert "No inference requests" in model.notes[0]
+
+
+def test_disabled_profiler_is_a_no_op():
+    profiler = ReplicaProfiler("SimpleModel:english_v1", enabled=False)
+    with profiler.track_onnx_load(), profiler.track_inference():
+        pass
+    assert profiler.requests == 0
+    assert profiler.onnx_session_load_bytes == 0
+
+
+@pytest.fixture
+def heap_tracing():
+    yield
+    tracemalloc.stop()
+
+
+def test_recommendation_flags_heap_tracing():
+    profile = make_profile("Canary", "c", rss_peak_mib=100, cpu_p95=0.1).model_copy(update={"heap_traced": True})
+    [recommendation] = recommend_actor_options([profile])
+    assert "PROFILING_TRACE_HEAP" in recommendation.notes[0]
+
+
+def test_enabled_profiler_snapshot(heap_tracing):
+    profiler = ReplicaProfiler("SimpleModel:english_v1", enabled=True, trace_heap=True)
+    with profiler.track_inference():
+        buffer = bytearray(8 * MIB)
+    snapshot = profiler.snapshot()
+    del buffer
+
+    assert snapshot.requests == 1
+    assert snapshot.heap_traced
+    assert snapshot.rss_peak_bytes >= snapshot.rss_bytes > 0
+    assert len(snapshot.top_allocations) > 0
+
+
+def test_heap_tracing_is_opt_in():
+    profiler = ReplicaProfiler("Canary", enabled=True, trace_heap=False)
+    assert not tracemalloc.is_tracing()
+    snapshot = profiler.snapshot()
+    assert not snapshot.heap_traced
+    assert snapshot.top_allocations == []
+
+
+def test_ad_hoc_snapshots_do_not_record_cpu_utilization():
+    profiler = ReplicaProfiler("APIIngress", enabled=True, trace_heap=False)
+    # Idle windows, as recorded by the periodic monitor
+    for _ in range(3):
+        time.sleep(0.05)
+        profiler._mark_cpu()
+    baseline = profiler.snapshot().cpu_utilization_p95
+
+    # Back-to-back snapshots while busy, as when serving /admin/profile or /admin/sizing
+    for _ in range(3):
+        sum(i * i for i in range(100_000))
+        snapshot = profiler.snapshot()
+
+    assert len(profiler.cpu_utilization) == 3
+    assert snapshot.cpu_utilization_p95 == baseline < 0.5
+
+
+class FakeCollector:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.reported = []
+
+    @property
+    def report(self):
+        return self
+
+    async def remote(self, profile):
+        if self.fail:
+            raise RayError("collector died")
+        self.reported.append(profile)
+
+
+def test_collector_handle_is_cached_until_ray_error(monkeypatch):
+    collectors = [FakeCollector(fail=True), FakeCollector()]
+    lookups = iter(collectors)
+    monkeypatch.setattr(profiling, "get_collector", lambda: next(lookups))
+    profiler = ReplicaProfiler("Canary", enabled=True, trace_heap=False)
+
+    async def report(times):
+        for _ in range(times):
+            await profiler.report()
+
+    asyncio.run(report(3))
+    # The handle is dropped after the RayError, then resolved once and reused
+    assert profiler._collector is collectors[1]
+    assert len(collectors[1].reported) == 2
+
+
+def busy_loop(stop):
+    total = 0
+    while not stop:
+        total += sum(i * i for i in range(1000))
+    return total
+
+
+def test_cpu_sample_finds_busy_user_code():
+    profiler = ReplicaProfiler("SimpleModel:english_v1", enabled=True, trace_heap=False)
+    stop = []
+    started = threading.Event()
+
+    idle = threading.Event()
+
+    def handle_request():
+        with profiler.track_inference():
+            started.set()
+            busy_loop(stop)
+
+    def handle_blocked_request():
+        with profiler.track_inference():
+            idle.wait()
+
+    # Idle threads, whether registered as user code or not, must not show up
+    idle_user_thread = threading.Thread(target=handle_blocked_request)
+    idle_other_thread = threading.Thread(target=idle.wait)
+    busy_thread = threading.Thread(target=handle_request)
+    for thread in (idle_user_thread, idle_other_thread, busy_thread):
+        thread.start()
+    started.wait()
+    try:
+        cpu_profile = profiler.sample_cpu(duration_s=0.5, interval_s=0.005)
+    finally:
+        stop.append(True)
+        idle.set()
+        for thread in (idle_user_thread, idle_other_thread, busy_thread):
+            thread.join()
+
+    assert cpu_profile.samples > 0
+    assert cpu_profile.stacks
+    assert "busy_loop" in cpu_profile.stacks[0].stack
+    assert all(
+        "busy_loop" in stack.stack or "handle_request" in stack.stack for stack in cpu_profile.stacks
+    )